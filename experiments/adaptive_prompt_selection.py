@@ -0,0 +1,103 @@
+import networkx as nx
+import numpy as np
+import pandas as pd
+import sys
+
+from time import time
+
+sys.path.append("./")  # Run from top level dir of project
+
+from vilnius.design import sample_label_permutations
+from vilnius.fact import generate_facts
+from vilnius.gpt3 import gpt3_query
+from vilnius.graph import assign_names_to_nodes, generate_dag
+from vilnius.prompt import (
+    generate_binary_question_prompt,
+    generate_templated_prompt_header,
+)
+from vilnius.question import few_shot_balanced_types, generate_all_pair_questions
+from vilnius.sequential import adaptive_evaluation
+
+# Same setting as prompt_selection.py, but configurations that are clearly worse than the best one
+# (or whose accuracy is already known precisely enough) stop being queried early.
+np.random.seed(3)
+G = generate_dag(n=6, p=0.4)
+
+real_words = False
+shot = -1  # Convention: -1 means zero shot with no CoT prompting
+n_trials = 10
+trial_seed = 0  # The same label permutations are used for every configuration
+
+# Questions for each configuration, pooled over relabelling trials. Each question stores its full prompt.
+configs = {}
+for prompt_type in ["v6", "v7", "v8"]:
+    for fact_type in ["v1", "v2", "v3"]:
+        config_questions = []
+        for trial, permutation in enumerate(
+            sample_label_permutations(
+                G, n_trials, seed=trial_seed, dedupe_automorphisms=True
+            )
+        ):
+            G = assign_names_to_nodes(G, use_real_words=real_words)
+
+            # Shuffle the nodes labels (used to assign various Xi labels to the same graph structure)
+            G = nx.relabel_nodes(
+                G, dict(zip(G.nodes(), np.array(G.nodes())[permutation]))
+            )
+
+            facts = generate_facts(G, fact_type=fact_type)
+            prompt_header = generate_templated_prompt_header(
+                G, facts, prompt_type=prompt_type
+            )
+
+            questions = generate_all_pair_questions(G, facts=facts)
+            questions["prompt"] = [
+                prompt_header
+                + generate_binary_question_prompt(
+                    q,
+                    few_shot_balanced_types(
+                        shot if shot > 0 else 0, questions, exclude=[qidx]
+                    ),
+                )
+                for qidx, q in questions.iterrows()
+            ]
+            questions["trial"] = trial
+            questions["permutation"] = [permutation] * len(questions)
+            config_questions.append(questions)
+
+        configs[(prompt_type, fact_type)] = pd.concat(
+            config_questions, ignore_index=True
+        )
+
+
+def answer_fn(config, q):
+    model_answer = gpt3_query(q["prompt"], deterministic=True)
+    print(
+        "Config:",
+        config,
+        "Type:",
+        q["type"],
+        "\n",
+        q["prompt"],
+        model_answer,
+        "\nTrue answer:",
+        q["answer"],
+    )
+    print("\n" * 2)
+    return model_answer
+
+
+question_answers, summary = adaptive_evaluation(configs, answer_fn, seed=0)
+question_answers["real_words"] = real_words
+question_answers["shot"] = shot
+question_answers["prompt_type"] = [c[0] for c in question_answers.config]
+question_answers["fact_type"] = [c[1] for c in question_answers.config]
+
+print(summary.to_string())
+print("Queries by configuration:")
+print(question_answers.groupby(["prompt_type", "fact_type"]).size())
+
+question_answers.drop(columns=["config"]).to_csv(
+    f"adaptive_prompt_selection_results_{time()}.csv"
+)
+summary.to_csv(f"adaptive_prompt_selection_summary_{time()}.csv")
@@ -0,0 +1,55 @@
+"""
+Compare plain and hedged queries against the local stub server (see stub_server.py), where a
+fraction of the requests stall. Runs without an OpenAI API key.
+
+Usage:
+    python experiments/hedging_demo.py [p_slow] [delay]
+
+"""
+import numpy as np
+import openai
+import os
+import sys
+import threading
+
+from time import time
+
+sys.path.append("./")  # Run from top level dir of project
+os.environ.setdefault("OPENAI_API_KEY", "stub")
+
+from stub_server import make_server
+from vilnius import gpt3
+
+
+n_queries = 30
+p_slow = float(sys.argv[1]) if len(sys.argv) > 1 else 0.2
+delay = float(sys.argv[2]) if len(sys.argv) > 2 else 5.0
+
+
+def run(name, query):
+    durations = []
+    for _ in range(n_queries):
+        start = time()
+        query("Question: Does X0 cause X1?\nAnswer:")
+        durations.append(time() - start)
+    print(
+        f"{name:<16} total: {np.sum(durations):5.1f} s, "
+        + f"median: {np.median(durations):4.2f} s, max: {np.max(durations):4.2f} s"
+    )
+
+
+print(f"{n_queries} queries per run, {p_slow:.0%} of the requests stall for {delay} s")
+for name, query in [
+    ("plain", gpt3.gpt3_query),
+    ("hedged", gpt3.gpt3_query_hedged),
+    ("hedged (again)", gpt3.gpt3_query_hedged),
+]:
+    # A new server for each run, so that every run sees the same sequence of slow requests
+    server = make_server(p_slow=p_slow, delay=delay, seed=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    openai.api_base = f"http://127.0.0.1:{server.server_address[1]}/v1"
+    if name == "hedged":
+        # Start from scratch, without the latencies measured by the plain queries
+        gpt3._latencies.clear()
+    run(name, query)
+    server.shutdown()
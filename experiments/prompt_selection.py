@@ -3,20 +3,21 @@ import numpy as np
 import pandas as pd
 import sys
 
-from itertools import permutations
 from time import sleep, time
 
 sys.path.append("./")  # Run from top level dir of project
 
+from vilnius.design import sample_label_permutations
 from vilnius.evaluation import check_answer_binary, evaluate_fact_accuracy
 from vilnius.fact import generate_facts
-from vilnius.gpt3 import gpt3_query
-from vilnius.graph import assign_names_to_nodes, generate_dag, plot_graph
+from vilnius.gpt3 import gpt3_query_hedged, gpt3_query_zscot_pipeline
+from vilnius.graph import assign_names_to_nodes, generate_dag
 from vilnius.prompt import (
     generate_binary_question_prompt,
     generate_templated_prompt_header,
 )
 from vilnius.question import few_shot_balanced_types, generate_all_pair_questions
+from vilnius.render import GraphRenderer
 
 
 # Generate a graph with a fixed structure
@@ -33,8 +34,11 @@ G = generate_dag(n=6, p=0.4)
 # np.random.seed(3)
 # G = generate_dag(n=10, p=0.4)
 
-f = plot_graph(G)
-f.savefig(f"prompt_selection_{time()}.png")
+# Figures are optional and rendered in the background to avoid blocking the experiment
+render_figures = True
+if render_figures:
+    renderer = GraphRenderer(max_workers=1)
+    renderer.submit(G, f"prompt_selection_{time()}.png")
 
 print("Types of questions and abundance:")
 print(generate_all_pair_questions(G, facts=generate_facts(G)).type.value_counts())
@@ -46,17 +50,18 @@ missed_answers = []
 question_answers = []
 
 max_permutations = 10
+trial_seed = 0  # The same label permutations are used for every configuration
 for real_words in [False]:
     for shot in [-1]:  # Convention: -1 means zero shot with no CoT prompting
         for prompt_type in ["v6", "v7", "v8"]:
             for fact_type in ["v1", "v2", "v3"]:
                 for trial, permutation in enumerate(
-                    list(set(permutations(range(len(G.nodes())))))[: max_permutations]
+                    sample_label_permutations(
+                        G, max_permutations, seed=trial_seed, dedupe_automorphisms=True
+                    )
                 ):
                     G = assign_names_to_nodes(G, use_real_words=real_words)
 
-                    permutation = np.random.permutation(len(G.nodes()))
-
                     # Shuffle the nodes labels (used to assign various Xi labels to the same graph structure)
                     G = nx.relabel_nodes(
                         G, dict(zip(G.nodes(), np.array(G.nodes())[permutation]))
@@ -70,7 +75,21 @@ for real_words in [False]:
 
                     questions = generate_all_pair_questions(G, facts=facts)
 
+                    if shot == 0:
+                        # Zero-shot chain of thought prompting requires two queries per question, so the
+                        # queries for all the questions are pipelined rather than issued one after the other
+                        zscot_answers = gpt3_query_zscot_pipeline(
+                            [
+                                prompt_header + generate_binary_question_prompt(q)
+                                for _, q in questions.iterrows()
+                            ],
+                            example="yes/no",
+                            deadline=120,
+                            return_exceptions=True,
+                        )
+
                     correct = 0
+                    answered = 0
                     for qidx, q in questions.iterrows():
                         print("Question", qidx + 1, "of", questions.shape[0])
                         few_shot_examples = few_shot_balanced_types(
@@ -82,32 +101,42 @@ for real_words in [False]:
                         )
 
                         # Query the model
-                        if shot == 0:
-                            print("---> ZERO SHOT CoT")
-                            # If zero-shot, we use zero-shot chain of thought prompting, which requires a special procedure
-                            model_cot, model_answer = gpt3_query_zscot(
-                                prompt_header + question_prompt, example="yes/no"
-                            )
-                            print(
-                                question_prompt,
-                                model_cot,
-                                "\nFinal answer: ",
-                                model_answer,
-                            )
-                            model_answer = (
-                                model_cot + " So the answer is: " + model_answer
-                            )
-                        else:
-                            print(f"---> {shot} SHOT")
-                            model_answer = gpt3_query(
-                                prompt_header + question_prompt, deterministic=True
-                            )
-                            print(
-                                "Type:", q["type"], "\n", question_prompt, model_answer, "\nTrue answer:", q["answer"]
+                        try:
+                            if shot == 0:
+                                print("---> ZERO SHOT CoT")
+                                # If zero-shot, we use zero-shot chain of thought prompting, which requires a special procedure
+                                if isinstance(zscot_answers[qidx], Exception):
+                                    raise zscot_answers[qidx]
+                                model_cot, model_answer = zscot_answers[qidx]
+                                print(
+                                    question_prompt,
+                                    model_cot,
+                                    "\nFinal answer: ",
+                                    model_answer,
+                                )
+                                model_answer = (
+                                    model_cot + " So the answer is: " + model_answer
+                                )
+                            else:
+                                print(f"---> {shot} SHOT")
+                                # Hedged requests avoid being stalled by a few very slow queries
+                                model_answer = gpt3_query_hedged(
+                                    prompt_header + question_prompt, deterministic=True
+                                )
+                                print(
+                                    "Type:", q["type"], "\n", question_prompt, model_answer, "\nTrue answer:", q["answer"]
+                                )
+                        except TimeoutError as error:
+                            # Record the question as missed rather than stalling the whole grid
+                            missed_answers.append(
+                                (shot, prompt_type, fact_type, trial, question_prompt, str(error))
                             )
+                            print("Missed:", missed_answers[-1])
+                            continue
 
                         is_correct = check_answer_binary(q["answer"], model_answer)
                         correct += int(is_correct)
+                        answered += 1
                         # if not is_correct:
                         #     missed_answers.append(
                         #         (question_prompt, model_answer, q["answer"])
@@ -129,9 +158,18 @@ for real_words in [False]:
                         )
                         question_answers.append(tmp)
                         print("\n" * 2)
-                    accuracy = correct / len(questions)
+                    # Questions without an answer before the deadline are not counted
+                    accuracy = correct / max(answered, 1)
                     print(accuracy)
                     trial_accuracies.append((real_words, shot, accuracy))
                     pd.DataFrame(question_answers).to_csv(
                         f"prompt_selection_results_{time()}.csv"
                     )
+                    if len(missed_answers) > 0:
+                        pd.DataFrame(
+                            missed_answers,
+                            columns=["shot", "prompt_type", "fact_type", "trial", "prompt", "error"],
+                        ).to_csv(f"prompt_selection_missed_{time()}.csv")
+
+if render_figures:
+    renderer.close()
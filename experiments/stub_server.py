@@ -0,0 +1,110 @@
+"""
+A local stub of the OpenAI completion API that injects slow responses. Used to check the behavior
+of the query functions (deadlines, hedged requests, streaming) without querying the real API.
+
+Usage:
+    python experiments/stub_server.py [port] [p_slow] [delay]
+    OPENAI_API_BASE=http://127.0.0.1:8000/v1 OPENAI_API_KEY=stub python experiments/prompt_selection.py
+
+"""
+import json
+import numpy as np
+import sys
+import threading
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import sleep, time
+
+
+# The completion returned for every prompt (truncated at the stop sequences of the request)
+COMPLETION = (
+    " Yes. We know from Fact 1 that X0 causes X1, so X0 is a cause of X1."
+    + "\n\nQuestion: Based on these facts, can we say that manipulating the value of X1 will cause"
+    + " a change in the value of X0?"
+)
+
+
+def make_server(
+    port=0, p_slow=0.05, delay=30.0, latency=0.2, token_latency=0.01, seed=None
+):
+    """
+    Create a stub server (call serve_forever to start it). Each request is answered after the
+    usual latency, except for a fraction p_slow of them that stall for delay seconds first.
+
+    Parameters:
+    -----------
+    port: int, default=0
+        The port to listen on (any free port if 0, see server.server_address).
+    p_slow: float, default=0.05
+        The probability that a request is slow.
+    delay: float, default=30.0
+        The additional latency (in seconds) of slow requests.
+    latency: float, default=0.2
+        The latency (in seconds) of the other requests.
+    token_latency: float, default=0.01
+        The time (in seconds) between two tokens of a streamed completion.
+    seed: int, default=None
+        Random seed.
+
+    """
+    rng = np.random.RandomState(seed)
+    lock = threading.Lock()
+
+    class _Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            with lock:
+                slow = rng.rand() < p_slow
+            sleep(latency + (delay if slow else 0))
+
+            text = COMPLETION
+            stop = request.get("stop") or []
+            for s in [stop] if isinstance(stop, str) else stop:
+                text = text.split(s)[0]
+
+            choice = dict(index=0, logprobs=None, finish_reason="stop")
+            completion = dict(
+                id="stub",
+                object="text_completion",
+                created=int(time()),
+                model=request.get("model", "stub"),
+            )
+            try:
+                if request.get("stream", False):
+                    # Server-sent events, one token at a time. The body ends when the connection is closed.
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/event-stream")
+                    self.end_headers()
+                    for token in text.split(" ")[1:]:
+                        completion["choices"] = [dict(choice, text=" " + token)]
+                        self.wfile.write(f"data: {json.dumps(completion)}\n\n".encode())
+                        self.wfile.flush()
+                        sleep(token_latency)
+                    self.wfile.write(b"data: [DONE]\n\n")
+                else:
+                    completion["choices"] = [dict(choice, text=text)]
+                    body = json.dumps(completion).encode()
+                    self.send_response(200)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+            except (BrokenPipeError, ConnectionResetError):
+                # The client has abandoned the request (e.g., deadline, hedged request or early end of a stream)
+                pass
+
+    return ThreadingHTTPServer(("127.0.0.1", port), _Handler)
+
+
+if __name__ == "__main__":
+    args = [float(x) for x in sys.argv[1:]]
+    server = make_server(
+        port=int(args[0]) if len(args) > 0 else 8000,
+        p_slow=args[1] if len(args) > 1 else 0.05,
+        delay=args[2] if len(args) > 2 else 30.0,
+    )
+    print(f"Listening on http://127.0.0.1:{server.server_address[1]}/v1")
+    server.serve_forever()
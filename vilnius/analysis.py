@@ -0,0 +1,384 @@
+"""
+Functions used to analyze tables of model answers (e.g., the results saved by the experiments)
+
+"""
+import numpy as np
+import pandas as pd
+import re
+
+from statistics import NormalDist
+
+from .evaluation import _FACT_CITATION
+from .sequential import wilson_interval
+
+
+# Used to concatenate texts before parsing them (ASCII record separator)
+_SEPARATOR = "\x1e"
+
+DEFAULT_GROUPS = ["type", "prompt_type", "fact_type", "shot"]
+
+
+def _findall_by_text(texts, pattern):
+    """
+    Find all the matches of a pattern (without capturing groups) in each text. The texts are
+    concatenated so that the regular expression runs once over all of them.
+
+    Returns:
+    --------
+    owners: np.ndarray
+        The index of the text of each match.
+    matches: np.ndarray
+        The matched strings.
+
+    """
+    found = np.array(
+        re.findall(_SEPARATOR + "|" + pattern, _SEPARATOR.join(texts), re.IGNORECASE),
+        dtype=object,
+    )
+    separators = found == _SEPARATOR
+    return np.cumsum(separators)[~separators], found[~separators]
+
+
+def _expand(codes, owners, n_owners):
+    """
+    Expand items that belong to distinct values (owners, sorted) to the rows that have these values
+    (codes, as returned by pd.factorize).
+
+    Returns:
+    --------
+    rows: np.ndarray
+        The row of each expanded item.
+    items: np.ndarray
+        The index of each expanded item in owners.
+
+    """
+    counts = np.bincount(owners, minlength=n_owners)
+    per_row = np.where(codes >= 0, counts[codes], 0)
+    rows = np.repeat(np.arange(len(codes)), per_row)
+    within = np.arange(len(rows)) - np.repeat(np.cumsum(per_row) - per_row, per_row)
+    return rows, (np.cumsum(counts) - counts)[codes[rows]] + within
+
+
+def _unique_pairs(owners, values):
+    """
+    Remove the duplicate (owner, value) pairs, where owners are sorted
+
+    """
+    pairs = np.unique(np.stack([owners, values], axis=1), axis=0)
+    return pairs[:, 0], pairs[:, 1]
+
+
+def _supporting_fact_sets(values):
+    """
+    Parse the distinct values of supporting facts, e.g., "[['1', '2'], ['3']]" has two sets:
+    ['1', '2'] and ['3'].
+
+    Returns:
+    --------
+    set_values: np.ndarray
+        The value of each set.
+    fact_sets: np.ndarray
+        The set of each supporting fact (index in set_values).
+    facts: np.ndarray
+        The number of each supporting fact.
+
+    """
+    set_values, sets = _findall_by_text(values, r"\[[^\[\]]*\]")
+    fact_sets, facts = _findall_by_text(sets, r"\d+")
+    return (set_values,) + _unique_pairs(fact_sets, facts.astype(int))
+
+
+def _fact_citations(values):
+    """
+    Parse the facts cited in the distinct values of answers (see evaluation.extract_fact_citations).
+
+    Returns:
+    --------
+    fact_values: np.ndarray
+        The value of each cited fact.
+    facts: np.ndarray
+        The number of each cited fact.
+
+    """
+    citation_values, citations = _findall_by_text(values, _FACT_CITATION)
+    fact_citations, facts = _findall_by_text(citations, r"\d+")
+    return _unique_pairs(citation_values[fact_citations], facts.astype(int))
+
+
+def fact_metrics(results, answer_column="model_answer"):
+    """
+    Score the facts cited in each answer, like evaluate_fact_accuracy but for a whole table
+    at once. The answers and supporting facts are parsed once per distinct value and every
+    distinct (answer, supporting facts) pair is scored once, using array operations. Like
+    evaluate_fact_accuracy, each answer is scored against the set of supporting facts with the lowest f1.
+
+    Parameters:
+    -----------
+    results: pd.DataFrame
+        One row per answered question, with the supporting_facts of the question. These can also
+        be string representations of the lists (e.g., when the results are loaded from a csv file).
+    answer_column: str, default="model_answer"
+        The column that contains the answers of the model.
+
+    Returns:
+    --------
+    metrics: pd.DataFrame
+        The tp, fp, fn, precision, recall and f1 of each answer (same index as results). Questions
+        without supporting facts are not scored (NaN).
+
+    """
+    supporting_facts = results["supporting_facts"]
+    if len(supporting_facts) > 0 and not isinstance(supporting_facts.iloc[0], str):
+        supporting_facts = supporting_facts.map(str)
+    answer_codes, answer_values = pd.factorize(results[answer_column])
+    support_codes, support_values = pd.factorize(supporting_facts)
+    set_values, fact_sets, facts = _supporting_fact_sets(support_values)
+    cited_values, cited_facts = _fact_citations(answer_values)
+
+    # Distinct (answer, supporting facts) pairs. Codes are shifted since missing values are coded -1.
+    n_support = len(support_values) + 1
+    pair_codes, pairs = pd.factorize((answer_codes + 1) * n_support + support_codes + 1)
+    pair_answers, pair_supports = pairs // n_support - 1, pairs % n_support - 1
+
+    # Expand the sets and citations to the pairs
+    set_pairs, set_items = _expand(pair_supports, set_values, len(support_values))
+    fact_sets, fact_items = _expand(set_items, fact_sets, len(set_values))
+    cited_pairs, cited_items = _expand(pair_answers, cited_values, len(answer_values))
+
+    # Confusion counts of each set (sets without facts are ignored)
+    n_facts = max(facts.max(initial=0), cited_facts.max(initial=0)) + 1
+    hits = np.isin(
+        set_pairs[fact_sets] * n_facts + facts[fact_items],
+        cited_pairs * n_facts + cited_facts[cited_items],
+    )
+    sizes = np.bincount(fact_sets, minlength=len(set_pairs))
+    tp = np.bincount(fact_sets, weights=hits, minlength=len(set_pairs))
+    fp = np.bincount(cited_pairs, minlength=len(pairs))[set_pairs] - tp
+    fn = sizes - tp
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        precision = np.where(tp + fp > 0, tp / (tp + fp), 0.0)
+        recall = tp / (tp + fn)
+        f1 = np.where(tp > 0, 2 * precision * recall / (precision + recall), 0.0)
+
+    # Set with the lowest f1 for each pair (the first one in case of ties, like evaluate_fact_accuracy)
+    valid = np.flatnonzero(sizes > 0)
+    order = valid[np.lexsort((valid, f1[valid], set_pairs[valid]))]
+    scored_pairs, first = np.unique(set_pairs[order], return_index=True)
+    scored_sets = np.full(len(pairs), -1)
+    scored_sets[scored_pairs] = order[first]
+
+    # Broadcast the metrics of the pairs to the rows
+    scored_sets = scored_sets[pair_codes]
+    scored = scored_sets >= 0
+    metrics = np.full((len(results), 6), np.nan)
+    metrics[scored] = np.stack([tp, fp, fn, precision, recall, f1], axis=1)[
+        scored_sets[scored]
+    ]
+
+    return pd.DataFrame(
+        metrics,
+        index=results.index,
+        columns=["tp", "fp", "fn", "precision", "recall", "f1"],
+    )
+
+
+def _group_codes(results, by):
+    """
+    Integer code of the group of each row and the corresponding group keys
+
+    """
+    grouped = results.groupby(by, sort=True, dropna=False, observed=True)
+    return grouped.ngroup().to_numpy(), grouped.size().index
+
+
+def _bootstrap_sums(values, groups, n_groups, n_bootstrap, rng):
+    """
+    Resample the rows of each group with replacement and sum their values.
+
+    Rather than materializing resampled row indices (n_rows x n_bootstrap), the rows of each group are
+    reduced to counts of their distinct values and the resampled counts are drawn from a multinomial
+    distribution, which is the exact same resampling distribution. The cost thus depends on the number
+    of groups and of distinct values (small for binary outcomes and fact counts), not on the number of rows.
+
+    Parameters:
+    -----------
+    values: np.ndarray
+        Integer array of shape (n_rows, n_values).
+    groups: np.ndarray
+        Integer group code of each row, in range(n_groups).
+
+    Returns:
+    --------
+    sums: np.ndarray
+        Array of shape (n_groups, n_bootstrap, n_values) of resampled sums.
+
+    """
+    # Encode each row of values as a single integer (mixed radix)
+    offsets = values.min(axis=0)
+    radix = values.max(axis=0) - offsets + 1
+    codes = np.zeros(len(values), dtype=np.int64)
+    for j in range(values.shape[1]):
+        codes = codes * radix[j] + (values[:, j] - offsets[j])
+    n_codes = int(np.prod(radix))
+
+    counts = np.bincount(groups * n_codes + codes, minlength=n_groups * n_codes)
+    counts = counts.reshape(n_groups, n_codes)
+
+    # Only keep the values that occur
+    present = np.flatnonzero(counts.sum(axis=0))
+    counts = counts[:, present]
+    distinct = np.stack(np.unravel_index(present, radix), axis=1) + offsets
+
+    sizes = counts.sum(axis=1)
+    draws = rng.multinomial(
+        sizes[:, None],
+        counts[:, None, :] / sizes[:, None, None],
+        size=(n_groups, n_bootstrap),
+    )
+    return draws @ distinct
+
+
+def _percentile_interval(samples, confidence):
+    """
+    Percentile bootstrap interval along the last axis
+
+    """
+    alpha = 1 - confidence
+    return np.nanquantile(samples, [alpha / 2, 1 - alpha / 2], axis=-1)
+
+
+def grouped_accuracy(
+    results,
+    by=DEFAULT_GROUPS,
+    method="wilson",
+    confidence=0.95,
+    n_bootstrap=1000,
+    seed=None,
+):
+    """
+    Accuracy of the answers by group, with confidence intervals.
+
+    Parameters:
+    -----------
+    results: pd.DataFrame
+        One row per answered question, with a boolean is_correct column.
+    by: list, default=["type", "prompt_type", "fact_type", "shot"]
+        The columns used to group the answers.
+    method: str, default="wilson"
+        How to compute the confidence intervals: "wilson" (score interval) or "bootstrap" (percentile).
+    confidence: float, default=0.95
+        Confidence level of the intervals.
+    n_bootstrap: int, default=1000
+        Number of bootstrap resamples.
+    seed: int, default=None
+        Random seed for the bootstrap.
+
+    Returns:
+    --------
+    accuracy: pd.DataFrame
+        The number of answers, number of correct answers, accuracy and confidence interval of each group.
+
+    """
+    groups, index = _group_codes(results, by)
+    correct = results["is_correct"].to_numpy().astype(int)
+    total = np.bincount(groups, minlength=len(index))
+    n_correct = np.bincount(groups, weights=correct, minlength=len(index))
+    accuracy = n_correct / total
+
+    if method == "wilson":
+        z = NormalDist().inv_cdf((1 + confidence) / 2)
+        lower, upper = wilson_interval(n_correct, total, z=z)
+    elif method == "bootstrap":
+        rng = np.random.default_rng(seed)
+        sums = _bootstrap_sums(correct[:, None], groups, len(index), n_bootstrap, rng)
+        lower, upper = _percentile_interval(sums[..., 0] / total[:, None], confidence)
+    else:
+        raise ValueError("Invalid confidence interval method!")
+
+    return pd.DataFrame(
+        dict(
+            n=total,
+            correct=n_correct.astype(int),
+            accuracy=accuracy,
+            lower=lower,
+            upper=upper,
+        ),
+        index=index,
+    )
+
+
+def grouped_fact_metrics(
+    results,
+    by=DEFAULT_GROUPS,
+    confidence=0.95,
+    n_bootstrap=1000,
+    seed=None,
+    metrics=None,
+):
+    """
+    Micro-averaged precision, recall and f1 of the cited facts by group, with percentile bootstrap
+    confidence intervals. Questions without supporting facts are ignored.
+
+    Parameters:
+    -----------
+    results: pd.DataFrame
+        One row per answered question (see fact_metrics).
+    by: list, default=["type", "prompt_type", "fact_type", "shot"]
+        The columns used to group the answers.
+    confidence: float, default=0.95
+        Confidence level of the intervals.
+    n_bootstrap: int, default=1000
+        Number of bootstrap resamples.
+    seed: int, default=None
+        Random seed for the bootstrap.
+    metrics: pd.DataFrame, default=None
+        Precomputed output of fact_metrics(results). Computed if not provided.
+
+    Returns:
+    --------
+    fact_metrics: pd.DataFrame
+        The number of scored answers, and the precision, recall and f1 of each group, along with their
+        confidence intervals.
+
+    """
+
+    def _scores(tp, fp, fn):
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return dict(
+                precision=tp / (tp + fp),
+                recall=tp / (tp + fn),
+                f1=2 * tp / (2 * tp + fp + fn),
+            )
+
+    if metrics is None:
+        metrics = fact_metrics(results)
+    scored = metrics["tp"].notna().to_numpy()
+    counts = metrics[["tp", "fp", "fn"]].to_numpy()[scored].astype(int)
+
+    # Only keep the groups that contain questions with supporting facts
+    groups, index = _group_codes(results, by)
+    present = np.flatnonzero(np.bincount(groups[scored], minlength=len(index)))
+    remap = np.full(len(index), -1)
+    remap[present] = np.arange(len(present))
+    groups, index = remap[groups[scored]], index[present]
+
+    sums = np.stack(
+        [np.bincount(groups, weights=c, minlength=len(index)) for c in counts.T],
+        axis=1,
+    )
+    out = dict(n=np.bincount(groups, minlength=len(index)))
+    out.update(_scores(*sums.T))
+
+    rng = np.random.default_rng(seed)
+    samples = _scores(
+        *np.moveaxis(
+            _bootstrap_sums(counts, groups, len(index), n_bootstrap, rng), -1, 0
+        )
+    )
+    for metric, sample in samples.items():
+        out[f"{metric}_lower"], out[f"{metric}_upper"] = _percentile_interval(
+            sample, confidence
+        )
+
+    return pd.DataFrame(out, index=index)
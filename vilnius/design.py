@@ -0,0 +1,111 @@
+"""
+Functions used to design experiments
+
+"""
+import networkx as nx
+import numpy as np
+
+from .graph import assign_names_to_nodes
+
+
+def _sample_distinct(draw, key, k, max_failures=1000):
+    """
+    Lazily yield up to k draws with distinct keys. Stops early if max_failures consecutive draws
+    are duplicates, which happens when (almost) all the possible values have been drawn.
+
+    """
+    seen = set()
+    failures = 0
+    while len(seen) < k and failures < max_failures:
+        x = draw()
+        x_key = key(x)
+        if x_key in seen:
+            failures += 1
+            continue
+        seen.add(x_key)
+        failures = 0
+        yield x
+
+
+def sample_label_permutations(G, k, seed=None, dedupe_automorphisms=False):
+    """
+    Lazily yield k distinct permutations of the node labels of a graph, without enumerating
+    all the permutations. The permutations are meant to relabel the graph as follows:
+    nx.relabel_nodes(G, dict(zip(G.nodes(), np.array(G.nodes())[permutation]))).
+
+    Parameters:
+    -----------
+    G: nx.DiGraph
+        The graph to relabel.
+    k: int
+        The number of permutations. Fewer are returned if the graph does not have k distinct labellings.
+    seed: int, default=None
+        Random seed.
+    dedupe_automorphisms: bool, default=False
+        Whether or not to skip permutations that result in the same labelled graph as a previous one
+        (i.e., that only differ by an automorphism of the graph). Such trials state the same causal
+        relationships between the same variables, although their prompts can still differ (e.g., in
+        the order in which the variables are listed and in the numbering of the facts).
+
+    Yields:
+    -------
+    permutation: np.ndarray
+        A permutation of range(len(G.nodes())).
+
+    """
+    rng = np.random.RandomState(seed)
+    index = {u: i for i, u in enumerate(G.nodes())}
+    edges = [(index[u], index[v]) for u, v in G.edges()]
+
+    def _key(permutation):
+        if dedupe_automorphisms:
+            return frozenset((permutation[i], permutation[j]) for i, j in edges)
+        return tuple(permutation)
+
+    return _sample_distinct(lambda: rng.permutation(len(index)), _key, k)
+
+
+def sample_name_assignments(
+    G, k, use_real_words=True, seed=None, dedupe_automorphisms=False
+):
+    """
+    Lazily yield k copies of a graph with distinct variable names (see graph.assign_names_to_nodes).
+    The names are shuffled, so that the same names are assigned to different variables when
+    they are not real words.
+
+    Parameters:
+    -----------
+    G: nx.DiGraph
+        The graph to relabel.
+    k: int
+        The number of copies. Fewer are returned if the graph does not have k distinct labellings.
+    use_real_words: bool, default=True
+        Whether or not to use real words as names.
+    seed: int, default=None
+        Random seed.
+    dedupe_automorphisms: bool, default=False
+        Whether or not to skip name assignments that result in the same labelled graph as a previous one
+        (i.e., the same names and the same edges between them).
+
+    Yields:
+    -------
+    G: nx.DiGraph
+        The relabelled graph.
+
+    """
+    rng = np.random.RandomState(seed)
+
+    def _draw():
+        H = assign_names_to_nodes(G, use_real_words=use_real_words, random_state=rng)
+        labels = np.array(H.nodes())
+        return nx.relabel_nodes(
+            H, dict(zip(H.nodes(), labels[rng.permutation(len(labels))]))
+        )
+
+    def _key(H):
+        if dedupe_automorphisms:
+            # The names of the isolated variables are not part of the edges
+            return frozenset(H.nodes()), frozenset(H.edges())
+        return tuple(H.nodes())
+
+    return _sample_distinct(_draw, _key, k)
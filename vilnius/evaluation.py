@@ -6,6 +6,10 @@ import numpy as np
 import re
 
 
+# Matches any enumeration of facts: fact(s) x[, y, z]
+_FACT_CITATION = r"\bfacts?\s\d+(?:,\s*\d+)*"
+
+
 def standardize(text):
     """
     Standardize strings of text to allow comparison.
@@ -25,21 +29,17 @@ def check_answer_binary(true_answer, answer):
     return re.search(f"\\b{true_answer}\\b", answer) is not None
 
 
-def evaluate_fact_accuracy(question, answer):
+def extract_fact_citations(answer):
     """
-    Check if list of facts is ok.
-    Notes: sometimes the model only returns numbers, e.g., because of 2,3.
-           Need to account for this in evaluation.
+    Extract the numbers of the facts cited in an answer.
 
     """
     # Use regular expression to find all facts mentioned with their number.
     # The regex will match any enumeration of facts: fact(s) x[, y, z]
-    matches = re.findall(
-        r"(?:\bfacts?)\s\d+(?:,\s*\d+)*", answer.lower(), re.IGNORECASE
-    )
+    matches = re.findall(_FACT_CITATION, answer.lower(), re.IGNORECASE)
 
     # Extract fact numbers
-    answer_facts = set(
+    return set(
         [
             int(y.strip())
             for x in matches
@@ -47,9 +47,98 @@ def evaluate_fact_accuracy(question, answer):
         ]
     )
 
+
+def parse_partial_answer(answer, stop=None):
+    """
+    Incrementally parse an answer that is being generated (e.g., a streamed completion) and
+    determine if it is already complete with respect to the evaluation. An answer is complete once
+    it contains a yes/no answer and a list of facts, and the paragraph in which the last of them
+    appears has ended. Sentences do not end the answer, since later sentences can still cite facts
+    (e.g., "We know from Fact 1 that ... We know from Fact 3 that ...") and the yes/no answer
+    can come after the facts, on another line. Answers without yes/no or without facts are only
+    complete once a stop sequence is generated (or the completion ends).
+
+    Parameters:
+    -----------
+    answer: str
+        The answer generated so far.
+    stop: list, default=None
+        Stop sequences. The answer is complete as soon as one of them is generated.
+
+    Returns:
+    --------
+    answer: str or None
+        The complete answer (truncated at the end of the paragraph or at the stop sequence)
+        or None if the answer is not complete yet.
+
+    """
+    for s in stop if stop is not None else []:
+        if s in answer:
+            return answer[: answer.index(s)]
+
+    # The lookahead makes sure that the word is complete (e.g., not the beginning of "not")
+    yes_no = re.search(r"\b(?:yes|no)\b(?=\W)", answer, re.IGNORECASE)
+    citations = list(re.finditer(_FACT_CITATION, answer, re.IGNORECASE))
+    if yes_no is None or len(citations) == 0:
+        return None
+
+    # The paragraph ends with the next line break, unless it follows a comma, since the enumeration
+    # of facts could then continue on the next line (e.g., "facts 1,\n2")
+    start = max(yes_no.end(), citations[-1].end()) - 1
+    end = re.search(r"[^,\s][ \t\r]*\n", answer[start:])
+    if end is None:
+        return None
+    return answer[: start + end.end() - 1].strip()
+
+
+def split_packed_answers(answer, n_questions):
+    """
+    Split the completion of a packed prompt (see prompt.generate_packed_question_prompt)
+    into one answer per question.
+
+    Parameters:
+    -----------
+    answer: str
+        The model completion. The prompt ends with the marker of the first answer, so any text
+        that precedes the first marker found in the completion is the answer to question 1.
+    n_questions: int
+        The number of questions packed in the prompt.
+
+    Returns:
+    --------
+    answers: list
+        One (answer, facts) tuple per question, where facts is the set of cited fact numbers.
+        Questions that the model did not answer get an empty answer and no facts.
+
+    """
+    parts = re.split(
+        r"\banswer\s+(\d+)\s*(?:\([^)]*\))?\s*:", answer, flags=re.IGNORECASE
+    )
+
+    answers = {}
+    for number, text in [(1, parts[0])] + list(zip(parts[1::2], parts[2::2])):
+        # Keep the first non-empty answer for each number (the model sometimes repeats the marker)
+        if text.strip() != "":
+            answers.setdefault(int(number), text.strip())
+
+    return [
+        (answers.get(i, ""), extract_fact_citations(answers.get(i, "")))
+        for i in range(1, n_questions + 1)
+    ]
+
+
+def evaluate_fact_accuracy(question, answer):
+    """
+    Check if list of facts is ok.
+    Notes: sometimes the model only returns numbers, e.g., because of 2,3.
+           Need to account for this in evaluation.
+
+    """
+    answer_facts = extract_fact_citations(answer)
+
     if len(question["supporting_facts"]) == 0:
         # TODO: deal with the fact where there are no supporting facts. In this case, any fact is a FP.
-        raise NotImplementError()  # I lost my implementation of this. See stackoverflow link in docs.
+        raise NotImplementedError()  # I lost my implementation of this. See stackoverflow link in docs.
     else:
         # Relevant facts are stored in question["supporting_facts"] as a list of sets.
         # Each set corresponds to a different valid explanation.
@@ -65,12 +154,20 @@ def evaluate_fact_accuracy(question, answer):
                 fn=len([f for f in facts if f not in answer_facts]),
             )
 
-            metrics["precision"] = metrics["tp"] / (metrics["tp"] + metrics["fp"])
+            # Note: there is always at least one supporting fact, so tp + fn > 0. When the model
+            #       cites no fact or no relevant fact, the precision and f1 are defined as 0.
+            metrics["precision"] = (
+                metrics["tp"] / (metrics["tp"] + metrics["fp"])
+                if metrics["tp"] + metrics["fp"] > 0
+                else 0.0
+            )
             metrics["recall"] = metrics["tp"] / (metrics["tp"] + metrics["fn"])
             metrics["f1"] = (
                 2
                 * (metrics["precision"] * metrics["recall"])
                 / (metrics["precision"] + metrics["recall"])
+                if metrics["tp"] > 0
+                else 0.0
             )
 
             metrics_by_set.append(metrics)
@@ -2,8 +2,17 @@
 Functions used to query GPT-3
 
 """
+import numpy as np
 import openai
 import os
+import requests
+
+from collections import defaultdict, deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from threading import Thread
+from time import time
+
+from .evaluation import parse_partial_answer
 
 
 try:
@@ -13,16 +22,362 @@ except:
         "You need to specify your OpenAI API key via the OPENAI_API_KEY environment variable."
     )
 
+# Latencies of the recent successful queries, by model. Used to decide when to send hedged requests.
+_latencies = defaultdict(lambda: deque(maxlen=1000))
+
 
-def gpt3_query(prompt, deterministic=True, model="text-davinci-002"):
+def latency_percentile(model, percentile=95, min_samples=20):
     """
-    Query GPT-3 for prompt completion
+    Percentile of the latency (in seconds) of the recent successful queries to a model, or None
+    if there are fewer than min_samples of them.
 
     """
-    completion = openai.Completion.create(
-        engine=model,
-        prompt=prompt,
-        max_tokens=250,
-        temperature=0 if deterministic else None,
-    )
+    latencies = list(_latencies[model])
+    if len(latencies) < min_samples:
+        return None
+    return np.percentile(latencies, percentile)
+
+
+def hedge_threshold(model, percentile=95, max_median_ratio=3.0, min_samples=20):
+    """
+    Time (in seconds) after which a query to a model is considered slow and is hedged: the given
+    percentile of the latency of the recent queries (see latency_percentile), but at most
+    max_median_ratio times their median latency. The cap matters when slow queries are more frequent
+    than the percentile assumes, since the percentile then falls among the slow queries themselves.
+    Only the cap is used while fewer than min_samples latencies are known, and None is returned if
+    none is known.
+
+    """
+    latencies = list(_latencies[model])
+    if len(latencies) == 0:
+        return None
+    threshold = max_median_ratio * np.median(latencies)
+    if len(latencies) >= min_samples:
+        threshold = min(threshold, latency_percentile(model, percentile, min_samples))
+    return threshold
+
+
+def _completion(prompt, deterministic, model, max_tokens, deadline):
+    """
+    Query GPT-3 for prompt completion, raising a TimeoutError once the deadline is exceeded
+
+    """
+    try:
+        completion = openai.Completion.create(
+            engine=model,
+            prompt=prompt,
+            max_tokens=max_tokens,
+            temperature=0 if deterministic else None,
+            request_timeout=deadline,
+        )
+    except openai.error.Timeout as error:
+        raise TimeoutError(f"No completion after {deadline} seconds.") from error
     return completion.choices[0].text.strip()
+
+
+def gpt3_query(
+    prompt, deterministic=True, model="text-davinci-002", max_tokens=250, deadline=None
+):
+    """
+    Query GPT-3 for prompt completion. If a deadline (in seconds) is specified, the request
+    is aborted with a TimeoutError once it is exceeded.
+
+    """
+    start = time()
+    answer = _completion(prompt, deterministic, model, max_tokens, deadline)
+    _latencies[model].append(time() - start)
+    return answer
+
+
+def gpt3_query_hedged(
+    prompt,
+    deterministic=True,
+    model="text-davinci-002",
+    max_tokens=250,
+    deadline=60,
+    hedge_percentile=95,
+    max_median_ratio=3.0,
+    max_hedges=1,
+):
+    """
+    Query GPT-3 for prompt completion, but send duplicate (hedged) requests when the query takes longer
+    than usual, and return the first completion. This limits the impact of the few very slow requests
+    on the overall duration of an experiment.
+
+    Only the latency of the request that provides the completion is recorded, so that abandoned
+    requests do not inflate the latency percentiles.
+
+    Note: requests in flight cannot be interrupted. They are abandoned and end at the latest when the
+          deadline is reached (or after the request timeout of openai if there is no deadline). Each
+          request runs in its own thread, so that abandoned requests never delay later ones.
+
+    Parameters:
+    -----------
+    deadline: float, default=60
+        Maximum time (in seconds) to wait for a completion, after which a TimeoutError is raised.
+        No limit if None.
+    hedge_percentile: float, default=95
+        A hedged request is sent every time this percentile of the latency of the model (see
+        hedge_threshold) elapses without a completion. No hedged request is sent for the first
+        query to a model.
+    max_median_ratio: float, default=3.0
+        Cap of the hedging threshold, as a multiple of the median latency of the model (see
+        hedge_threshold).
+    max_hedges: int, default=1
+        Maximum number of hedged requests.
+
+    """
+    start = time()
+    threshold = hedge_threshold(model, hedge_percentile, max_median_ratio)
+    max_attempts = 1 + (max_hedges if threshold is not None else 0)
+
+    def _launch():
+        future = Future()
+        attempt_start = time()
+        remaining = None if deadline is None else deadline - (attempt_start - start)
+
+        def _run():
+            try:
+                answer = _completion(
+                    prompt, deterministic, model, max_tokens, remaining
+                )
+                future.set_result((answer, time() - attempt_start))
+            except Exception as error:
+                future.set_exception(error)
+
+        Thread(target=_run, daemon=True).start()
+        return future
+
+    attempts = [_launch()]
+    pending = set(attempts)
+    while True:
+        # Wait until the next hedged request is due (or until the deadline)
+        next_hedge = threshold * len(attempts) if len(attempts) < max_attempts else None
+        wake_up = min(
+            [t for t in [next_hedge, deadline] if t is not None], default=None
+        )
+        done, pending = wait(
+            pending,
+            timeout=None if wake_up is None else max(0, wake_up - (time() - start)),
+            return_when=FIRST_COMPLETED,
+        )
+
+        for future in done:
+            if future.exception() is None:
+                answer, latency = future.result()
+                _latencies[model].append(latency)
+                return answer
+            error = future.exception()
+
+        if len(pending) == 0 and len(done) > 0:
+            # All the requests have failed
+            raise error
+        if deadline is not None and time() - start >= deadline:
+            raise TimeoutError(f"No completion after {deadline} seconds.")
+        if next_hedge is not None and time() - start >= next_hedge:
+            attempts.append(_launch())
+            pending.add(attempts[-1])
+
+
+def gpt3_query_stream(
+    prompt,
+    deterministic=True,
+    model="text-davinci-002",
+    stop=["\nQuestion:"],
+    max_tokens=250,
+    deadline=None,
+):
+    """
+    Query GPT-3 for prompt completion, but stream the completion and end the stream as soon as
+    the answer and its list of facts are complete (see evaluation.parse_partial_answer). This
+    reduces the latency and the number of completion tokens of each query.
+
+    If a deadline (in seconds) is specified, the stream is aborted with a TimeoutError once it is
+    exceeded. The deadline is checked as tokens arrive, and a stream that stalls is aborted once no
+    token has arrived for the duration of the deadline.
+
+    Note: set the OPENAI_API_BASE environment variable to test against a local streaming server
+          (e.g., experiments/stub_server.py).
+
+    """
+    start = time()
+    try:
+        completion = openai.Completion.create(
+            engine=model,
+            prompt=prompt,
+            max_tokens=max_tokens,
+            temperature=0 if deterministic else None,
+            stop=stop,
+            stream=True,
+            request_timeout=deadline,
+        )
+
+        text = ""
+        answer = None
+        try:
+            for chunk in completion:
+                text += chunk.choices[0].text
+                answer = parse_partial_answer(text, stop=stop)
+                if answer is not None:
+                    break
+                if deadline is not None and time() - start >= deadline:
+                    raise TimeoutError(f"No complete answer after {deadline} seconds.")
+        finally:
+            # Closing the stream closes the connection, which ends the generation on the server side
+            completion.close()
+
+    except (openai.error.Timeout, requests.exceptions.ConnectionError) as error:
+        # A stream that stalls fails with a connection error once the read times out
+        if deadline is not None and time() - start >= deadline:
+            raise TimeoutError(
+                f"No complete answer after {deadline} seconds."
+            ) from error
+        raise
+
+    return (answer if answer is not None else text).strip()
+
+
+def _zscot_reasoning_prompt(prompt):
+    """
+    First stage of zero-shot chain of thought prompting: elicit the reasoning
+
+    """
+    return prompt + "Let's think step by step."
+
+
+def _zscot_answer_prompt(prompt, cot, example):
+    """
+    Second stage of zero-shot chain of thought prompting: extract the answer from the reasoning
+
+    """
+    return (
+        _zscot_reasoning_prompt(prompt)
+        + f" {cot}\nTherefore, the answer ({example}) is"
+    )
+
+
+def gpt3_query_zscot(
+    prompt,
+    example="yes/no",
+    deterministic=True,
+    model="text-davinci-002",
+    deadline=None,
+):
+    """
+    Query GPT-3 using zero-shot chain of thought prompting (Kojima et al., 2022), i.e., first ask the model
+    to reason step by step and then to extract the answer from its reasoning. If a deadline (in seconds)
+    is specified, a TimeoutError is raised once the two queries have taken longer.
+
+    Returns:
+    --------
+    cot: str
+        The reasoning of the model.
+    answer: str
+        The final answer of the model.
+
+    """
+    return gpt3_query_zscot_pipeline(
+        [prompt],
+        example=example,
+        deterministic=deterministic,
+        model=model,
+        deadline=deadline,
+    )[0]
+
+
+def gpt3_query_zscot_pipeline(
+    prompts,
+    example="yes/no",
+    deterministic=True,
+    model="text-davinci-002",
+    max_reasoning_queries=8,
+    max_answer_queries=8,
+    deadline=None,
+    return_exceptions=False,
+):
+    """
+    Query GPT-3 using zero-shot chain of thought prompting for many prompts at once. The two stages
+    are pipelined: the answer extraction query of a prompt is issued as soon as its reasoning
+    is available, while the reasoning queries of the other prompts are still running.
+
+    Parameters:
+    -----------
+    prompts: list
+        The prompts (e.g., prompt header + question prompt).
+    example: str, default="yes/no"
+        The expected format of the answer.
+    max_reasoning_queries: int, default=8
+        Maximum number of concurrent queries for the reasoning stage.
+    max_answer_queries: int, default=8
+        Maximum number of concurrent queries for the answer extraction stage.
+    deadline: float, default=None
+        Maximum time (in seconds) for the two queries of a prompt, counted from the start of its
+        reasoning query, after which a TimeoutError is raised for this prompt. No limit if None.
+    return_exceptions: bool, default=False
+        Whether or not to return the error of the prompts whose queries failed (e.g., a TimeoutError)
+        in place of their (cot, answer) tuple, rather than raising the first error. This keeps the
+        answers to the other prompts.
+
+    Returns:
+    --------
+    answers: list
+        One (cot, answer) tuple per prompt, in the same order as the prompts.
+
+    """
+    results = [Future() for _ in prompts]
+
+    with ThreadPoolExecutor(max_reasoning_queries) as reasoning, ThreadPoolExecutor(
+        max_answer_queries
+    ) as extraction:
+
+        def _reason(i):
+            start = time()
+            cot = gpt3_query(
+                _zscot_reasoning_prompt(prompts[i]),
+                deterministic=deterministic,
+                model=model,
+                deadline=deadline,
+            )
+            return start, cot
+
+        def _extract(i, start, cot):
+            # The answer extraction query gets the time left by the reasoning query (it may have been queued)
+            remaining = None if deadline is None else deadline - (time() - start)
+            if remaining is not None and remaining <= 0:
+                raise TimeoutError(f"No completion after {deadline} seconds.")
+            answer = gpt3_query(
+                _zscot_answer_prompt(prompts[i], cot, example),
+                deterministic=deterministic,
+                model=model,
+                max_tokens=16,
+                deadline=remaining,
+            )
+            return cot, answer
+
+        def _forward(source, target):
+            # Propagates the outcome of a query to the result future
+            if source.exception() is not None:
+                target.set_exception(source.exception())
+            else:
+                target.set_result(source.result())
+
+        def _on_reasoning_done(i, future):
+            if future.exception() is not None:
+                results[i].set_exception(future.exception())
+            else:
+                extraction.submit(_extract, i, *future.result()).add_done_callback(
+                    lambda f: _forward(f, results[i])
+                )
+
+        for i in range(len(prompts)):
+            reasoning.submit(_reason, i).add_done_callback(
+                lambda f, i=i: _on_reasoning_done(i, f)
+            )
+
+        # Wait for all answers before the executors are shut down
+        if return_exceptions:
+            return [
+                r.exception() if r.exception() is not None else r.result()
+                for r in results
+            ]
+        return [r.result() for r in results]
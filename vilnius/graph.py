@@ -8,34 +8,407 @@ import numpy as np
 import pycorpora
 
 
-def assign_names_to_nodes(G, use_real_words=True):
+def assign_names_to_nodes(G, use_real_words=True, random_state=None):
     """
     Assigns names to the variables in the causal graph, which are later
     used to state the fact in natural language and formulate questions.
+    The names are drawn using random_state (a np.random.RandomState) if provided.
 
     """
     if use_real_words:
         words = pycorpora.words.nouns["nouns"]
-        labels = np.random.choice(words, len(G.nodes()), replace=False)
+        rng = random_state if random_state is not None else np.random
+        labels = rng.choice(words, len(G.nodes()), replace=False)
     else:
         labels = [f"X{i}" for i in range(len(G.nodes()))]
 
     return nx.relabel_nodes(G, dict(zip(G.nodes(), labels)))
 
 
-def generate_dag(n, p=0.2):
+def _dag_from_adjacency(A):
     """
-    Generate a random Erdos-Reyni DAG
+    Build a DAG from an adjacency matrix, after shuffling the node indices so that they
+    don't reveal the order in which the graph was generated.
 
     """
-    A = np.tril((np.random.rand(n, n) < p).astype(float), -1)
-    P = np.random.permutation(n)
+    P = np.random.permutation(A.shape[0])
     A = A[P][:, P]
     G = nx.DiGraph(A)
     assert nx.is_directed_acyclic_graph(G), "Graph is not acyclic."
     return G
 
 
+def generate_dag(n, p=0.2):
+    """
+    Generate a random Erdos-Reyni DAG
+
+    """
+    A = np.tril((np.random.rand(n, n) < p).astype(float), -1)
+    return _dag_from_adjacency(A)
+
+
+def depth_sizes_for_path_lengths(path_lengths):
+    """
+    Find the number of variables at each depth of a tree that contains a given number of causal
+    paths of each length. In a tree, every variable at depth d is reached by exactly one causal
+    path of each length up to d, so the number of paths of length k is the number of variables
+    at depth k or more. The sizes are found starting from the deepest variables. Every depth needs
+    at least one variable, so the number of short paths can exceed its target if the targets
+    favor long paths too much.
+
+    Any edge beyond those of a tree adds causal paths, so the generators that hit such targets
+    exactly all produce trees with these depth sizes, where the cause of each variable is at the
+    previous depth. They differ in how this cause is chosen: uniformly (generate_tree_dag and
+    generate_layered_dag with p=0, which are thus equivalent) or preferentially by degree, which
+    creates hubs (generate_scale_free_dag with m=1). generate_polytree additionally turns some
+    variables into colliders.
+
+    Parameters:
+    -----------
+    path_lengths: dict
+        Target number of (ordered) pairs of variables for each shortest path length.
+
+    Returns:
+    --------
+    depth_sizes: list
+        The number of variables at each depth, starting with a single root.
+
+    """
+    max_depth = max([k for k, c in path_lengths.items() if c > 0], default=0)
+    depth_sizes = [1] * (max_depth + 1)
+    deeper = 0
+    for k in range(max_depth, 0, -1):
+        depth_sizes[k] = max(path_lengths.get(k, 0) - deeper, 1)
+        deeper += depth_sizes[k]
+    return depth_sizes
+
+
+def _adjacency_by_depth(depth_sizes, m=1, preferential=False):
+    """
+    Adjacency matrix of a DAG whose variables are arranged by depth, where each variable outside
+    of depth 0 is caused by m variables of the previous depth, drawn uniformly or with probability
+    proportional to their degree (plus one). The shortest causal paths thus have the length of the
+    difference in depth and, for m=1, the number of paths of each length only depends on the number
+    of variables at each depth (see depth_sizes_for_path_lengths).
+
+    """
+    offsets = np.cumsum([0] + list(depth_sizes))
+    A = np.zeros((offsets[-1], offsets[-1]))
+    degree = np.zeros(offsets[-1])
+    for d in range(1, len(depth_sizes)):
+        candidates = np.arange(offsets[d - 1], offsets[d])
+        for i in range(offsets[d], offsets[d + 1]):
+            weights = (
+                degree[candidates] + 1 if preferential else np.ones(len(candidates))
+            )
+            causes = np.random.choice(
+                candidates,
+                min(m, len(candidates)),
+                replace=False,
+                p=weights / weights.sum(),
+            )
+            A[causes, i] = 1
+            degree[causes] += 1
+            degree[i] += len(causes)
+    return A
+
+
+def generate_layered_dag(layer_sizes=None, p=None, path_lengths=None):
+    """
+    Generate a random layered DAG, where edges only exist between consecutive layers. The shortest
+    causal path between two variables thus has the length of the difference between their layers.
+    Every variable outside of the first layer has at least one cause in the previous layer, so
+    every variable in layer k has causal paths of length k.
+
+    Parameters:
+    -----------
+    layer_sizes: list, default=None
+        The number of variables in each layer.
+    p: float, default=None
+        The probability of each edge between consecutive layers (0.5 if None, or 0 if path_lengths
+        is given).
+    path_lengths: dict, default=None
+        Target number of (ordered) pairs of variables for each shortest path length, from which the
+        layer sizes are derived (see depth_sizes_for_path_lengths), instead of layer_sizes. With the
+        default p=0, every variable has a single cause and the targets are hit: the DAG is then a
+        random tree whose layers are its depths, like generate_tree_dag. With p>0, the targets are
+        only lower bounds, since the additional edges add causal paths (often many more).
+
+    """
+    if path_lengths is not None:
+        layer_sizes = depth_sizes_for_path_lengths(path_lengths)
+        p = 0.0 if p is None else p
+    elif layer_sizes is None:
+        raise ValueError("Either layer_sizes or path_lengths must be given.")
+    elif p is None:
+        p = 0.5
+
+    offsets = np.cumsum([0] + list(layer_sizes))
+    A = np.zeros((offsets[-1], offsets[-1]))
+    for i in range(len(layer_sizes) - 1):
+        B = (np.random.rand(layer_sizes[i], layer_sizes[i + 1]) < p).astype(float)
+        # Make sure that every variable has at least one cause in the previous layer
+        orphans = np.flatnonzero(B.sum(axis=0) == 0)
+        B[np.random.randint(layer_sizes[i], size=len(orphans)), orphans] = 1
+        A[offsets[i] : offsets[i + 1], offsets[i + 1] : offsets[i + 2]] = B
+    return _dag_from_adjacency(A)
+
+
+def _chain_path_counts(length, n_causes, n_effects):
+    """
+    Number of causal paths of each length in a chain (see chain_components_for_path_lengths)
+
+    """
+    counts = {k: n_causes + n_effects + length - 1 - k for k in range(1, length)}
+    counts[length] = n_causes * n_effects
+    return counts
+
+
+def chain_components_for_path_lengths(path_lengths):
+    """
+    Find disjoint causal chains that contain a given number of causal paths of each length. A chain
+    of length L links n_causes variables to n_effects variables through L - 1 mediators, so it
+    contains n_causes * n_effects paths of length L, but only n_causes + n_effects + L - 1 - k paths
+    of each shorter length k. The chains are found starting from the longest paths, with numbers of
+    causes and effects that keep the number of shorter paths low. Long chains still contain shorter
+    paths, so the number of short paths can exceed its target if the targets favor long paths.
+
+    Parameters:
+    -----------
+    path_lengths: dict
+        Target number of (ordered) pairs of variables for each shortest path length.
+
+    Returns:
+    --------
+    chains: list
+        One (length, n_causes, n_effects) tuple per chain.
+
+    """
+
+    def _shorter_paths(chains):
+        return sum(
+            c
+            for chain in chains
+            for k, c in _chain_path_counts(*chain).items()
+            if k < chain[0]
+        )
+
+    chains = []
+    for L in sorted(path_lengths, reverse=True):
+        covered = sum(_chain_path_counts(*chain).get(L, 0) for chain in chains)
+        remaining = path_lengths[L] - covered
+        if remaining <= 0:
+            continue
+
+        # A single chain, with the most balanced number of causes and effects
+        a = max(d for d in range(1, int(np.sqrt(remaining)) + 1) if remaining % d == 0)
+        single = [(L, a, remaining // a)]
+
+        # Several balanced chains, which is better when the target has no balanced factorization
+        balanced = []
+        while remaining > 0:
+            a = int(np.sqrt(remaining))
+            balanced.append((L, a, remaining // a))
+            remaining -= a * (remaining // a)
+
+        chains += min(single, balanced, key=_shorter_paths)
+
+    return chains
+
+
+def generate_chain_dag(path_lengths, p=0.0):
+    """
+    Generate a chain-rich DAG whose causal paths follow a target distribution of shortest path
+    lengths (i.e., of chain_k questions). The graph is made of disjoint causal chains (see
+    chain_components_for_path_lengths), where each chain can start with several causes and end with
+    several effects, aligned by depth. Additional edges can link variables at consecutive depths of
+    different chains, which keeps the shortest path lengths equal to the difference in depth but
+    adds causal paths beyond the target ones.
+
+    Parameters:
+    -----------
+    path_lengths: dict
+        Target number of (ordered) pairs of variables for each shortest path length,
+        e.g., {1: 10, 3: 5, 5: 5}.
+    p: float, default=0.0
+        The probability of each edge between consecutive depths of different chains.
+
+    """
+    sizes = [
+        [a] + [1] * (L - 1) + [b]
+        for L, a, b in chain_components_for_path_lengths(path_lengths)
+    ]
+    chain = np.repeat(
+        np.arange(len(sizes)), np.array([sum(s) for s in sizes], dtype=int)
+    )
+    depth = np.repeat(
+        np.array([d for s in sizes for d in range(len(s))], dtype=int),
+        np.array([n for s in sizes for n in s], dtype=int),
+    )
+
+    consecutive = depth[None, :] == depth[:, None] + 1
+    same_chain = chain[None, :] == chain[:, None]
+    A = (
+        consecutive & (same_chain | (np.random.rand(len(depth), len(depth)) < p))
+    ).astype(float)
+    return _dag_from_adjacency(A)
+
+
+def generate_tree_dag(n=None, max_depth=None, path_lengths=None):
+    """
+    Generate a random causal tree (out-tree), where each variable has a single cause except for
+    the root. The shortest causal paths are bounded by the depth of the tree.
+
+    Parameters:
+    -----------
+    n: int, default=None
+        The number of variables.
+    max_depth: int, default=None
+        The maximum depth of the tree (unbounded if None). The variables are not connected if 0.
+    path_lengths: dict, default=None
+        Target number of (ordered) pairs of variables for each shortest path length. If given, the
+        number of variables at each depth is derived from it (see depth_sizes_for_path_lengths),
+        which hits the targets exactly unless they favor long paths, and n and max_depth are ignored.
+        The cause of each variable is drawn uniformly among the variables of the previous depth.
+
+    """
+    if path_lengths is None and n is None:
+        raise ValueError("Either n or path_lengths must be given.")
+    if path_lengths is not None:
+        return _dag_from_adjacency(
+            _adjacency_by_depth(depth_sizes_for_path_lengths(path_lengths))
+        )
+
+    A = np.zeros((n, n))
+    depth = np.zeros(n, dtype=int)
+    for i in range(1, n):
+        candidates = np.arange(i)
+        if max_depth is not None:
+            candidates = candidates[depth[:i] < max_depth]
+        if len(candidates) == 0:
+            continue
+        parent = np.random.choice(candidates)
+        A[parent, i] = 1
+        depth[i] = depth[parent] + 1
+    return _dag_from_adjacency(A)
+
+
+def generate_polytree(n=None, max_depth=None, p_reverse=0.5, path_lengths=None):
+    """
+    Generate a random polytree, i.e., a DAG whose skeleton is a tree. It is obtained by reversing
+    the edges of a random tree (see generate_tree_dag) at random, which results in variables
+    with multiple causes (colliders) and in many pairs of variables without causal paths.
+
+    Parameters:
+    -----------
+    n: int, default=None
+        The number of variables.
+    max_depth: int, default=None
+        The maximum depth of the underlying tree (unbounded if None).
+    p_reverse: float, default=0.5
+        The probability of reversing each edge of the tree.
+    path_lengths: dict, default=None
+        Target number of (ordered) pairs of variables for each shortest path length. If given, n and
+        max_depth are ignored and the edges are not reversed, since reversing them changes the causal
+        paths. Instead, the polytree is assembled from several trees: the variables at depth 1 of a
+        tree with the target paths (see depth_sizes_for_path_lengths), except for one, become the roots
+        of separate trees with probability p_reverse, and each of these roots then causes a leaf of
+        another tree (a collider). Each such edge adds a single causal path of length 1, in place of
+        the one from the former cause of the root, so the targets are hit as for generate_tree_dag.
+
+    """
+    if path_lengths is None:
+        if n is None:
+            raise ValueError("Either n or path_lengths must be given.")
+        A = nx.to_numpy_array(generate_tree_dag(n, max_depth=max_depth))
+        reverse = A * (np.random.rand(n, n) < p_reverse)
+        return _dag_from_adjacency(A - reverse + reverse.T)
+
+    depth_sizes = depth_sizes_for_path_lengths(path_lengths)
+    if len(depth_sizes) > 1:
+        n_roots = np.random.binomial(depth_sizes[1] - 1, p_reverse)
+        depth_sizes[0] += n_roots
+        depth_sizes[1] -= n_roots
+    A = _adjacency_by_depth(depth_sizes)
+
+    # Root of the tree of each variable (causes always precede their effects)
+    roots = np.arange(len(A))
+    for i in range(depth_sizes[0], len(A)):
+        roots[i] = roots[np.argmax(A[:, i])]
+    leaves = np.flatnonzero(A.sum(axis=1) == 0)
+    leaves = leaves[leaves >= depth_sizes[0]]
+
+    # Join the trees one by one, starting with one that has leaves
+    has_leaves = set(roots[leaves])
+    trees = sorted(
+        np.random.permutation(depth_sizes[0]), key=lambda r: r not in has_leaves
+    )
+    joined = [trees[0]]
+    for r in trees[1:]:
+        candidates = leaves[np.isin(roots[leaves], joined)]
+        A[r, np.random.choice(candidates)] = 1
+        joined.append(r)
+    return _dag_from_adjacency(A)
+
+
+def generate_scale_free_dag(n=None, m=1, path_lengths=None):
+    """
+    Generate a random scale-free DAG by preferential attachment: each new variable is caused by m
+    existing variables, chosen with probability proportional to their degree (plus one). A few
+    variables thus become hubs that cause many others.
+
+    Parameters:
+    -----------
+    n: int, default=None
+        The number of variables.
+    m: int, default=1
+        The number of causes of each new variable.
+    path_lengths: dict, default=None
+        Target number of (ordered) pairs of variables for each shortest path length. If given, n is
+        ignored and the variables are arranged by depth like a tree with the target paths (see
+        depth_sizes_for_path_lengths): each variable is attached to m variables of the previous depth,
+        chosen with probability proportional to their degree (plus one). With m=1, the result is a
+        tree that hits the targets and whose hubs are found within each depth, rather than across the
+        whole graph. With m>1, the targets are only lower bounds, since additional causes add causal
+        paths.
+
+    """
+    if path_lengths is None and n is None:
+        raise ValueError("Either n or path_lengths must be given.")
+    if path_lengths is not None:
+        return _dag_from_adjacency(
+            _adjacency_by_depth(
+                depth_sizes_for_path_lengths(path_lengths), m=m, preferential=True
+            )
+        )
+
+    A = np.zeros((n, n))
+    degree = np.zeros(n)
+    for i in range(1, n):
+        weights = degree[:i] + 1
+        causes = np.random.choice(
+            i, min(m, i), replace=False, p=weights / weights.sum()
+        )
+        A[causes, i] = 1
+        degree[causes] += 1
+        degree[i] += len(causes)
+    return _dag_from_adjacency(A)
+
+
+def path_length_distribution(G):
+    """
+    Count the (ordered) pairs of variables by length of the shortest causal path between them,
+    which corresponds to the number of questions of type chain_k (and chain_k_anti).
+
+    """
+    counts = {}
+    for _, lengths in nx.all_pairs_shortest_path_length(G):
+        for k in lengths.values():
+            if k > 0:
+                counts[k] = counts.get(k, 0) + 1
+    return dict(sorted(counts.items()))
+
+
 def load_graph(filename):
     """
     Load a graph from a file in edgelist format
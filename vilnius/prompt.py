@@ -137,6 +137,68 @@ def generate_binary_question_prompt(
     return prompt
 
 
+def generate_packed_question_prompt(questions, example_questions=None):
+    """
+    Pack several questions about the same graph into a single prompt, so that they share
+    one prompt header. Questions and answers are numbered so that the answers can be matched
+    back to the questions (see evaluation.split_packed_answers).
+
+    Parameters:
+    -----------
+    questions: pd.DataFrame
+        The questions for which we want an answer from the model.
+    example_questions: pd.DataFrame, default=None
+        Solved questions used for few-shot prompting. They are packed in the same format.
+
+    Returns:
+    --------
+    prompt: str
+        A prompt that ends with the marker of the first answer.
+
+    """
+
+    def _template_questions(queries, answers):
+        """
+        Numbered list of questions followed by the numbered list of answers
+
+        """
+        out = "\n".join(
+            [f"Question {i + 1}: {query}" for i, query in enumerate(queries)]
+        )
+        out += "\n" + "\n".join(
+            [
+                f"Answer {i + 1} (yes/no, facts): {answer}"
+                for i, answer in enumerate(answers)
+            ]
+        )
+        return out
+
+    prompt = (
+        "Instructions: Answer each of the following questions with yes/no "
+        + "and explain why using a list of facts. Answer the questions in order "
+        + "and number each answer like the question it answers.\n\n"
+    )
+
+    # Include example questions if any are provided
+    if example_questions is not None and len(example_questions) > 0:
+        prompt += (
+            _template_questions(
+                example_questions["query"],
+                [
+                    f"{q['explanation']} Hence, the answer is {q['answer']}."
+                    for _, q in example_questions.iterrows()
+                ],
+            )
+            + "\n\n"
+        )
+
+    # The questions for which we want an answer from the model. Only the first answer
+    # marker is included, the model is expected to produce the following ones.
+    prompt += _template_questions(questions["query"], [""])
+
+    return prompt
+
+
 def generate_potential_cause_question_prompt(
     facts, question, example_questions=None, variables=None, causal_sufficiency=True
 ):
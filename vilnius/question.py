@@ -6,6 +6,8 @@ import networkx as nx
 import numpy as np
 import pandas as pd
 
+from functools import partial
+
 from .utils import _capfirst, _enum
 
 
@@ -20,6 +22,171 @@ def log_question(t, q, a, questions, qid=""):
     return questions
 
 
+def _causal_paths(G, s, t):
+    """
+    All the directed paths from {s} to {t}. The search is restricted to the subgraph of the variables
+    that lie on such a path, so that it never explores the (possibly exponentially many) paths from {s}
+    that do not lead to {t}.
+
+    """
+    descendants = nx.descendants(G, s)
+    if t not in descendants:
+        return []
+    between = descendants & nx.ancestors(G, t)
+    return list(nx.all_simple_paths(G.subgraph(between | {s, t}), s, t))
+
+
+def generate_pair_questions(G, facts, s, t, relation=None):
+    """
+    Generates questions about the causal relationship between {s} and {t} and tags them by
+    difficulty (i.e., length of the causal chain).
+
+    Parameters:
+    -----------
+    G: nx.DiGraph
+        A causal directed acyclic graph, with the facts assigned to its edges (see fact.generate_facts).
+    facts: dict
+        The facts, indexed by their number.
+    s, t: nodes of G
+        The potential cause and effect.
+    relation: str, default=None
+        The relationship between {s} and {t}, if it is already known: "causal" (a path exists from {s}
+        to {t}), "anti-causal" (a path exists from {t} to {s}) or "none". The searches for paths that
+        cannot exist are then skipped. If None, the relationship is determined from the graph.
+
+    Returns:
+    --------
+    questions: list
+        One dict per formulation of the question.
+
+    """
+    symbol = f"cause({s}; {t})"
+
+    # Find all paths of causation
+    all_paths = _causal_paths(G, s, t) if relation in [None, "causal"] else []
+
+    if len(all_paths) > 0:
+        # Case: a causal path exists from {s} to {t}
+        # ---------------------------------------------
+
+        # There exists a causal path, so the answer is yes.
+        answer = "yes"
+
+        # Shortest path first
+        all_paths = np.array(all_paths, dtype=object)[
+            np.argsort([len(x) for x in all_paths])
+        ]
+
+        # Gather the combination of relevant facts along each causal path
+        valid_fact_sets = [
+            [str(G[path[i]][path[i + 1]]["fact"]) for i in range(len(path) - 1)]
+            for path in all_paths
+        ]
+
+        # Determine the explanation used for few-shot learning and the kind of question using
+        # the shortest causal path.
+        shortest_path = all_paths[0]
+        # TODO: pretty printing function
+        explanation = (
+            _enum(
+                [
+                    f"we know from Fact {G[shortest_path[i]][shortest_path[i + 1]]['fact']} that {facts[G[shortest_path[i]][shortest_path[i + 1]]['fact']]}"
+                    for i in range(len(shortest_path) - 1)
+                ],
+                final="and",
+            )
+            + f", so acting on {s} does cause a change in {t}"
+        )
+
+        explanation = (
+            _enum(
+                [
+                    f"we know from Fact {G[shortest_path[i]][shortest_path[i + 1]]['fact']} "
+                    + f"that {facts[G[shortest_path[i]][shortest_path[i + 1]]['fact']]}"
+                    for i in range(len(shortest_path) - 1)
+                ],
+                final="and",
+            )
+            + f", so {s} is a cause of {t} and {t} is an effect of {s}. Based on our "
+            + f"definition of causation, we know that manipulating the value of {s} "
+            + f"will cause a change in the value of {t}."
+        )
+        explanation = _capfirst(explanation)
+
+        kind = f"chain_{len(shortest_path) - 1}"
+
+    else:
+
+        # Find all anti-causal paths
+        all_paths = _causal_paths(G, t, s) if relation in [None, "anti-causal"] else []
+
+        if len(all_paths) > 0:
+            # Case: an anti-causal path exists from {t} to {s}
+            # --------------------------------------------------
+
+            # There exists an anti-causal path, so the answer is no.
+            answer = "no"
+
+            # Shortest path first
+            all_paths = np.array(all_paths, dtype=object)[
+                np.argsort([len(x) for x in all_paths])
+            ]
+
+            # Gather the combination of relevant facts along each causal path
+            valid_fact_sets = [
+                [str(G[path[i]][path[i + 1]]["fact"]) for i in range(len(path) - 1)]
+                for path in all_paths
+            ]
+
+            # Determine the explanation used for few-shot learning and the kind of question using
+            # the shortest causal path.
+            shortest_path = all_paths[0]
+            explanation = (
+                _enum(
+                    [
+                        f"we know from Fact {G[shortest_path[i]][shortest_path[i + 1]]['fact']} "
+                        + f"that {facts[G[shortest_path[i]][shortest_path[i + 1]]['fact']]}"
+                        for i in range(len(shortest_path) - 1)
+                    ],
+                    final="and",
+                )
+                + f", so {t} is a cause of {s} and {s} is an effect of {t}. Based on our "
+                + f"definition of causation, whe know that manipulating the value of {s} "
+                + f"cannot cause a change in the value of {t} since causation is asymmetric."
+            )
+            explanation = _capfirst(explanation)
+            kind = f"chain_{len(shortest_path) - 1}_anti"
+
+        else:
+            # Case: no undirected path exists between {s} and {t}
+            answer = "no"
+            # Based on the question formulation, the answer could be "maybe" or "no".
+            # As long as we ask: do the facts support that s causes t, the answer is no.
+            explanation = (
+                "There is no evidence of a causal relationship between these variables."
+            )
+            valid_fact_sets = []
+            kind = "chain_none"
+
+    # To allow for multiple formulations of the same question
+    queries = [
+        # f"Does acting on {s} change {t}?"
+        f"Based on these facts, can we say that manipulating the value of {s} will cause a change in the value of {t}?"
+    ]
+
+    return [
+        dict(
+            symbol=symbol,
+            query=q,
+            answer=answer,
+            supporting_facts=valid_fact_sets,
+            explanation=explanation,
+            type=kind,
+        )
+        for q in queries
+    ]
+
+
 def generate_all_pair_questions(G, facts):
     """
     Generates questions about the causal relationships that exist between any pair of variables
@@ -31,132 +198,101 @@ def generate_all_pair_questions(G, facts):
     questions = []
     for s in G.nodes():
         for t in set(G.nodes()) - {s}:
-            symbol = f"cause({s}; {t})"
-
-            # Find all paths of causation
-            all_paths = list(nx.all_simple_paths(G, s, t))
-
-            if len(all_paths) > 0:
-                # Case: a causal path exists from {s} to {t}
-                # ---------------------------------------------
-
-                # There exists a causal path, so the answer is yes.
-                answer = "yes"
-
-                # Shortest path first
-                all_paths = np.array(all_paths, dtype=object)[
-                    np.argsort([len(x) for x in all_paths])
-                ]
-
-                # Gather the combination of relevant facts along each causal path
-                valid_fact_sets = [
-                    [str(G[path[i]][path[i + 1]]["fact"]) for i in range(len(path) - 1)]
-                    for path in all_paths
-                ]
-
-                # Determine the explanation used for few-shot learning and the kind of question using
-                # the shortest causal path.
-                shortest_path = all_paths[0]
-                # TODO: pretty printing function
-                explanation = (
-                    _enum(
-                        [
-                            f"we know from Fact {G[shortest_path[i]][shortest_path[i + 1]]['fact']} that {facts[G[shortest_path[i]][shortest_path[i + 1]]['fact']]}"
-                            for i in range(len(shortest_path) - 1)
-                        ],
-                        final="and",
-                    )
-                    + f", so acting on {s} does cause a change in {t}"
-                )
-
-                explanation = (
-                    _enum(
-                        [
-                            f"we know from Fact {G[shortest_path[i]][shortest_path[i + 1]]['fact']} "
-                            + f"that {facts[G[shortest_path[i]][shortest_path[i + 1]]['fact']]}"
-                            for i in range(len(shortest_path) - 1)
-                        ],
-                        final="and",
-                    )
-                    + f", so {s} is a cause of {t} and {t} is an effect of {s}. Based on our "
-                    + f"definition of causation, we know that manipulating the value of {s} "
-                    + f"will cause a change in the value of {t}."
-                )
-                explanation = _capfirst(explanation)
+            questions += generate_pair_questions(G, facts, s, t)
 
-                kind = f"chain_{len(shortest_path) - 1}"
+    return pd.DataFrame(questions)
 
-            else:
 
-                # Find all anti-causal paths
-                all_paths = list(nx.all_simple_paths(G, t, s))
-
-                if len(all_paths) > 0:
-                    # Case: an anti-causal path exists from {t} to {s}
-                    # --------------------------------------------------
-
-                    # There exists an anti-causal path, so the answer is no.
-                    answer = "no"
-
-                    # Shortest path first
-                    all_paths = np.array(all_paths, dtype=object)[
-                        np.argsort([len(x) for x in all_paths])
-                    ]
-
-                    # Gather the combination of relevant facts along each causal path
-                    valid_fact_sets = [
-                        [
-                            str(G[path[i]][path[i + 1]]["fact"])
-                            for i in range(len(path) - 1)
-                        ]
-                        for path in all_paths
-                    ]
-
-                    # Determine the explanation used for few-shot learning and the kind of question using
-                    # the shortest causal path.
-                    shortest_path = all_paths[0]
-                    explanation = (
-                        _enum(
-                            [
-                                f"we know from Fact {G[shortest_path[i]][shortest_path[i + 1]]['fact']} "
-                                + f"that {facts[G[shortest_path[i]][shortest_path[i + 1]]['fact']]}"
-                                for i in range(len(shortest_path) - 1)
-                            ],
-                            final="and",
-                        )
-                        + f", so {t} is a cause of {s} and {s} is an effect of {t}. Based on our "
-                        + f"definition of causation, whe know that manipulating the value of {s} "
-                        + f"cannot cause a change in the value of {t} since causation is asymmetric."
-                    )
-                    explanation = _capfirst(explanation)
-                    kind = f"chain_{len(shortest_path) - 1}_anti"
-
-                else:
-                    # Case: no undirected path exists between {s} and {t}
-                    answer = "no"
-                    # Based on the question formulation, the answer could be "maybe" or "no".
-                    # As long as we ask: do the facts support that s causes t, the answer is no.
-                    explanation = "There is no evidence of a causal relationship between these variables."
-                    valid_fact_sets = []
-                    kind = "chain_none"
-
-            # To allow for multiple formulations of the same question
-            queries = [
-                # f"Does acting on {s} change {t}?"
-                f"Based on these facts, can we say that manipulating the value of {s} will cause a change in the value of {t}?"
-            ]
+def sample_pair_questions(G, facts, n_per_type, seed=None, max_attempts=100):
+    """
+    Generates questions for a sample of pairs of variables, stratified by question type. Unlike
+    generate_all_pair_questions, this does not consider every pair of variables. The pairs of each
+    type are drawn directly using the topological levels of the graph and searches that are
+    limited to the neighborhood of the sampled variables, so the cost scales with the number
+    of questions rather than with the number of pairs.
+
+    Parameters:
+    -----------
+    G: nx.DiGraph
+        A causal directed acyclic graph, with the facts assigned to its edges (see fact.generate_facts).
+    facts: list
+        The facts, as returned by fact.generate_facts.
+    n_per_type: dict
+        Number of questions to sample for each type (e.g., {"chain_2": 10, "chain_2_anti": 10, "chain_none": 20}).
+    seed: int, default=None
+        Random seed.
+    max_attempts: int, default=100
+        Number of draws per requested question before giving up on a type. Fewer questions than
+        requested are returned for types that are rare or absent from the graph.
+
+    Returns:
+    --------
+    questions: pd.DataFrame
+        The sampled questions, in the same format as generate_all_pair_questions.
 
-            questions += [
-                dict(
-                    symbol=symbol,
-                    query=q,
-                    answer=answer,
-                    supporting_facts=valid_fact_sets,
-                    explanation=explanation,
-                    type=kind,
-                )
-                for q in queries
-            ]
+    """
+    rng = np.random.RandomState(seed)
+    facts = dict(facts)
+    nodes = list(G.nodes())
+
+    # Topological level of each node: there can only be a path from a lower to a higher level
+    level = {u: i for i, gen in enumerate(nx.topological_generations(G)) for u in gen}
+
+    # Length of the longest path that starts at each node: a node at distance k can only exist below
+    # nodes whose height is at least k
+    height = {}
+    for u in reversed(list(nx.topological_sort(G))):
+        height[u] = max([height[c] + 1 for c in G.successors(u)], default=0)
+
+    def _draw_chain(k, sources):
+        if len(sources) == 0:
+            return None
+        s = sources[rng.randint(len(sources))]
+        distances = nx.single_source_shortest_path_length(G, s, cutoff=k)
+        targets = [t for t, d in distances.items() if d == k]
+        if len(targets) == 0:
+            return None
+        return s, targets[rng.randint(len(targets))]
+
+    def _draw_anti_chain(k, sources):
+        pair = _draw_chain(k, sources)
+        return None if pair is None else pair[::-1]
+
+    def _draw_none():
+        s, t = [nodes[i] for i in rng.choice(len(nodes), 2, replace=False)]
+        if level[s] != level[t]:
+            # Variables on the same level cannot be connected by a causal path
+            a, b = (s, t) if level[s] < level[t] else (t, s)
+            if nx.has_path(G, a, b):
+                return None
+        return s, t
+
+    pairs = set()
+    questions = []
+    for kind, n in n_per_type.items():
+        if kind == "chain_none":
+            draw = _draw_none
+            relation = "none"
+        else:
+            k = int(kind.split("_")[1])
+            sources = [u for u in nodes if height[u] >= k]
+            if kind.endswith("_anti"):
+                draw = partial(_draw_anti_chain, k, sources)
+                relation = "anti-causal"
+            else:
+                draw = partial(_draw_chain, k, sources)
+                relation = "causal"
+
+        sampled = 0
+        for _ in range(n * max_attempts):
+            if sampled == n:
+                break
+            pair = draw()
+            if pair is None or pair in pairs:
+                continue
+            pairs.add(pair)
+            questions += generate_pair_questions(G, facts, *pair, relation=relation)
+            sampled += 1
 
     return pd.DataFrame(questions)
 
@@ -0,0 +1,173 @@
+"""
+Functions used to render graph figures in the background
+
+"""
+import networkx as nx
+import numpy as np
+
+from concurrent.futures import ThreadPoolExecutor
+
+
+def _graph_structure(G):
+    """
+    Hashable description of the structure of a graph that ignores node labels. Graphs
+    obtained by relabelling the nodes of another graph (e.g., assign_names_to_nodes)
+    share the same structure and can thus share the same layout.
+
+    """
+    index = {u: i for i, u in enumerate(G.nodes())}
+    return len(index), tuple(sorted((index[u], index[v]) for u, v in G.edges()))
+
+
+def spring_layout(structure, seed=0):
+    """
+    Compute the spring layout of a graph structure (see _graph_structure).
+
+    Returns:
+    --------
+    positions: np.ndarray
+        Node positions (one row per node, in the order of the structure indices).
+
+    """
+    n, edges = structure
+    H = nx.DiGraph()
+    H.add_nodes_from(range(n))
+    H.add_edges_from(edges)
+    layout = nx.spring_layout(H, seed=seed)
+    return np.array([layout[i] for i in range(n)]).reshape(n, 2)
+
+
+def render_graph(labels, structure, filename, positions=None, seed=0):
+    """
+    Render a graph to a file without touching the global pyplot state (the figure is drawn
+    on its own Agg canvas), so that it is headless and can run in worker threads.
+
+    Parameters:
+    -----------
+    labels: list
+        The labels of the nodes, in the order of the structure indices.
+    structure: tuple
+        The structure of the graph, as returned by _graph_structure.
+    filename: str
+        The path of the output figure.
+    positions: np.ndarray, default=None
+        Node positions (one row per node). If None, a spring layout is computed.
+    seed: int, default=0
+        Random seed for the spring layout.
+
+    Returns:
+    --------
+    positions: np.ndarray
+        The node positions that were used, which can be reused for graphs with the same structure.
+
+    """
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    n, edges = structure
+    H = nx.DiGraph()
+    H.add_nodes_from(range(n))
+    H.add_edges_from(edges)
+
+    if positions is None:
+        positions = spring_layout(structure, seed=seed)
+
+    # Same drawing as nx.draw, which would otherwise also update the pyplot state
+    fig = Figure()
+    FigureCanvasAgg(fig)
+    ax = fig.add_axes((0, 0, 1, 1))
+    nx.draw_networkx(
+        nx.relabel_nodes(H, dict(enumerate(labels))),
+        pos=dict(zip(labels, positions)),
+        ax=ax,
+        with_labels=True,
+        node_color="red",
+        node_size=1000,
+    )
+    ax.set_axis_off()
+    fig.savefig(filename)
+
+    return positions
+
+
+class GraphRenderer:
+    """
+    Renders graph figures in a pool of worker threads so that plotting stays off the critical
+    path of experiments (which mostly wait for queries). Threads rather than processes are used so
+    that the experiment scripts do not need to be importable by worker processes, which is required
+    on platforms that spawn them (e.g., macOS and Windows).
+
+    Layouts are cached per graph structure, so that relabelled versions of the same graph are drawn
+    identically and the spring layout is only computed once. The layout of a new structure is
+    queued before its first figure, so the figures that are queued before it is available wait for it
+    rather than computing it again.
+
+    Parameters:
+    -----------
+    max_workers: int, default=None
+        Number of worker threads (defaults to the ThreadPoolExecutor default).
+    seed: int, default=0
+        Random seed for the spring layout.
+
+    """
+
+    def __init__(self, max_workers=None, seed=0):
+        self.seed = seed
+        self.layouts = {}
+        self.pending = []
+        self._pool = ThreadPoolExecutor(max_workers=max_workers)
+
+    def submit(self, G, filename):
+        """
+        Queue a graph for rendering and return immediately
+
+        """
+        labels = list(G.nodes())
+        structure = _graph_structure(G)
+        if structure not in self.layouts:
+            # Queued first, so it is running or done by the time the figures that need it start
+            self.layouts[structure] = self._pool.submit(
+                spring_layout, structure, self.seed
+            )
+        layout = self.layouts[structure]
+
+        future = self._pool.submit(
+            lambda: render_graph(
+                labels, structure, filename, layout.result(), self.seed
+            )
+        )
+
+        # Forget the figures that are already rendered, but keep the failed ones so that
+        # wait() can raise their errors
+        self.pending = [
+            f
+            for f in self.pending
+            if not f.done() or f.cancelled() or f.exception() is not None
+        ] + [future]
+        return future
+
+    def wait(self):
+        """
+        Block until all queued figures are rendered. Raises the first rendering error, if any.
+
+        """
+        pending, self.pending = self.pending, []
+        for future in pending:
+            future.result()
+
+    def close(self, wait=True):
+        """
+        Shut down the worker pool
+
+        """
+        try:
+            if wait:
+                self.wait()
+        finally:
+            self._pool.shutdown(wait=wait, cancel_futures=not wait)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close(wait=exc[0] is None)
@@ -0,0 +1,181 @@
+"""
+Functions used to evaluate prompt configurations adaptively, stopping early when the
+outcome is already clear
+
+"""
+import numpy as np
+import pandas as pd
+
+from .evaluation import check_answer_binary
+
+
+def wilson_interval(correct, total, z=1.96):
+    """
+    Wilson score confidence interval for a binomial proportion. Works elementwise on arrays.
+
+    Parameters:
+    -----------
+    correct: int or np.ndarray
+        Number of successes.
+    total: int or np.ndarray
+        Number of trials. The interval is [0, 1] when there are no trials.
+    z: float, default=1.96
+        Quantile of the standard normal distribution (1.96 for a 95% interval).
+
+    Returns:
+    --------
+    lower, upper: float or np.ndarray
+        The bounds of the confidence interval.
+
+    """
+    correct = np.asarray(correct, dtype=float)
+    total = np.asarray(total, dtype=float)
+    n = np.maximum(total, 1)
+    p = correct / n
+    denominator = 1 + z**2 / n
+    center = (p + z**2 / (2 * n)) / denominator
+    halfwidth = z * np.sqrt(p * (1 - p) / n + z**2 / (4 * n**2)) / denominator
+    lower = np.where(total > 0, center - halfwidth, 0.0)
+    upper = np.where(total > 0, center + halfwidth, 1.0)
+    return np.clip(lower, 0, 1)[()], np.clip(upper, 0, 1)[()]
+
+
+def _interleave_types(questions, rng):
+    """
+    Order the questions randomly, but alternating between question types so that every type
+    is represented early in the stream.
+
+    """
+    groups = [
+        list(rng.permutation(labels))
+        for _, labels in sorted(questions.groupby("type").groups.items())
+    ]
+    order = []
+    while any(groups):
+        for group in groups:
+            if len(group) > 0:
+                order.append(group.pop())
+    return order
+
+
+def adaptive_evaluation(
+    configs,
+    answer_fn,
+    z=1.96,
+    min_queries=20,
+    target_halfwidth=0.05,
+    max_queries=None,
+    seed=None,
+):
+    """
+    Evaluate several prompt configurations by streaming their questions in rounds, one question per
+    configuration per round. A configuration stops being queried once its accuracy confidence interval
+    is separated from (below) the one of the leading configuration, or once the interval is narrower
+    than the target precision. Counts are also kept by question type while streaming, and a configuration
+    is never stopped before every type has min_queries answers (or all its questions were asked), so that
+    the accuracy by type is estimated for every configuration.
+
+    Note: the intervals are recomputed after every round, so their nominal coverage is optimistic.
+          Use a larger z for a more conservative stopping rule.
+
+    Parameters:
+    -----------
+    configs: dict
+        Maps a (hashable) configuration key to a pd.DataFrame of questions, as generated by
+        question.generate_all_pair_questions.
+    answer_fn: callable
+        Function answer_fn(config, question) that queries the model and returns its answer.
+    z: float, default=1.96
+        Quantile of the standard normal distribution used for the confidence intervals.
+    min_queries: int, default=20
+        Minimum number of questions of each type answered before a configuration can be stopped.
+    target_halfwidth: float, default=0.05
+        Stop a configuration once its interval half-width falls below this value.
+    max_queries: int, default=None
+        Maximum number of questions answered per configuration.
+    seed: int, default=None
+        Random seed for the order in which the questions are asked.
+
+    Returns:
+    --------
+    answers: pd.DataFrame
+        One row per question asked, with the configuration, the model answer and whether it is correct.
+    summary: pd.DataFrame
+        Accuracy and confidence interval for each configuration, overall (type "all") and by question type,
+        along with the reason why the configuration was stopped.
+
+    """
+    rng = np.random.RandomState(seed)
+    streams = {c: iter(_interleave_types(q, rng)) for c, q in configs.items()}
+    correct = {c: 0 for c in configs}
+    total = {c: 0 for c in configs}
+    available_by_type = {c: dict(q.type.value_counts()) for c, q in configs.items()}
+    total_by_type = {c: {t: 0 for t in available_by_type[c]} for c in configs}
+    status = {}
+    answers = {c: [] for c in configs}
+
+    active = list(configs)
+    while len(active) > 0:
+        for c in active:
+            qidx = next(streams[c], None)
+            if qidx is None or (max_queries is not None and total[c] >= max_queries):
+                status[c] = "exhausted"
+                continue
+
+            q = configs[c].loc[qidx]
+            model_answer = answer_fn(c, q)
+            is_correct = check_answer_binary(q["answer"], model_answer)
+            correct[c] += int(is_correct)
+            total[c] += 1
+            total_by_type[c][q["type"]] += 1
+
+            tmp = dict(q)
+            tmp.update(dict(config=c, model_answer=model_answer, is_correct=is_correct))
+            answers[c].append(tmp)
+
+        # Configurations that have enough answers of every type to be stopped
+        ready = {
+            c: total[c] >= min_queries
+            and all(
+                n >= min(min_queries, available_by_type[c][t])
+                for t, n in total_by_type[c].items()
+            )
+            for c in configs
+        }
+
+        # Stopping rules
+        lower, upper = {}, {}
+        for c in configs:
+            lower[c], upper[c] = wilson_interval(correct[c], total[c], z=z)
+        leader = max(configs, key=lambda c: correct[c] / max(total[c], 1))
+        for c in active:
+            if c in status or not ready[c]:
+                continue
+            if c != leader and ready[leader] and upper[c] < lower[leader]:
+                status[c] = "separated"
+            elif (upper[c] - lower[c]) / 2 <= target_halfwidth:
+                status[c] = "precise"
+
+        active = [c for c in active if c not in status]
+
+    summary = []
+    for c in configs:
+        subset = pd.DataFrame(answers[c], columns=["type", "is_correct"])
+        for kind, group in [("all", subset)] + list(subset.groupby("type")):
+            n = len(group)
+            k = int(group.is_correct.sum())
+            lower, upper = wilson_interval(k, n, z=z)
+            summary.append(
+                dict(
+                    config=c,
+                    type=kind,
+                    n=n,
+                    accuracy=k / n if n > 0 else np.nan,
+                    lower=lower,
+                    upper=upper,
+                    status=status[c],
+                )
+            )
+
+    answers = pd.DataFrame([a for c in configs for a in answers[c]])
+    return answers, pd.DataFrame(summary)